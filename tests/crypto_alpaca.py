@@ -9,9 +9,208 @@ import websocket
 import threading
 import time
 import os
+import queue
+import random
+import re
+import sys
+from array import array
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 
+# orjson parses/serializes several times faster than the stdlib; use it when installed.
+# Both variants take and produce UTF-8 bytes so frames are never re-encoded.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+# KEY=value lines of a .env file; comments and blank lines never match
+_ENV_RE = re.compile(r'^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$', re.MULTILINE)
+
+# Crypto pair symbols such as BTC/USD or ETH/USDT, matched in a single pass
+_SYMBOL_RE = re.compile(r'[A-Z0-9]{2,10}/(?:USD|USDT|USDC|EUR|BTC)')
+
+# Interned once so the per-symbol format choice can compare by identity
+_DOGE = sys.intern("DOGE/USD")
+
+# Frames waiting for the consumer before quote-only frames start being shed
+_INBOX_HIGH_WATER = 1024
+_QUOTE_TAG = b'"T":"q"'
+_TRADE_TAG = b'"T":"t"'
+_BAR_TAG = b'"T":"b"'
+
+# Reconnect backoff: first retry delay and the ceiling it doubles up to, in seconds
+_RETRY_BASE = 1.25
+_RETRY_CAP = 35.0
+
+# Alpaca error codes that retrying can't fix: auth failed, insufficient subscription
+_FATAL_ERROR_CODES = frozenset((402, 409))
+
+# Tick line templates; the comma-grouped variants are for prices above $1,000
+_TRADE_LINE = "[{t}] 📈 {s} TRADE: ${p:,.2f} | Size: {sz:.4f}"
+_QUOTE_LINE = "[{t}] 📊 {s} QUOTE: ${b:.2f} / ${a:.2f} | Spread: ${sp:.2f} ({pct:.3f}%)"
+_QUOTE_LINE_WIDE = "[{t}] 📊 {s} QUOTE: ${b:,.2f} / ${a:,.2f} | Spread: ${sp:.2f} ({pct:.3f}%)"
+_BAR_LINE = "[{t}] 📈 {s} BAR: O:${o:.2f} H:${h:.2f} L:${l:.2f} C:${c:.2f} | Vol: {v:.2f} | VWAP: ${vw:.2f}"
+_BAR_LINE_WIDE = "[{t}] 📈 {s} BAR: O:${o:,.2f} H:${h:,.2f} L:${l:,.2f} C:${c:,.2f} | Vol: {v:.2f} | VWAP: ${vw:,.2f}"
+
+# Field extractors for Alpaca's fixed crypto message schema; each is a single C call
+_TRADE_FIELDS = itemgetter('S', 'p', 's')
+_QUOTE_FIELDS = itemgetter('S', 'bp', 'ap')
+_BAR_FIELDS = itemgetter('S', 'o', 'h', 'l', 'c', 'v', 'vw')
+
+# Subscription message key for each stream name - Alpaca crypto uses full names, not single letters
+_STREAM_KEYS = {
+    "trades": "trades",
+    "quotes": "quotes",
+    "bars": "bars",
+    "daily_bars": "dailyBars",
+    "orderbook": "orderbooks"
+}
+
+
+@lru_cache(maxsize=64)
+def _control_payload(action, plan):
+    """Serialize a subscribe/unsubscribe message from (stream, symbols) pairs, cached per plan"""
+    msg = {"action": action}
+    for stream, symbols in plan:
+        key = _STREAM_KEYS.get(stream)
+        if key is not None:
+            msg[key] = list(symbols)
+    return _json_dumps(msg)
+
+
+def _subscription_plan(symbols, streams):
+    """
+    Normalize subscribe/unsubscribe arguments into a hashable (stream, symbols) plan
+    symbols may be a list shared by every stream, or a {stream: symbols} dict
+    Returns the plan, the distinct symbols and the stream names
+    """
+    if isinstance(symbols, dict):
+        plan = tuple((stream, tuple(syms)) for stream, syms in symbols.items())
+    else:
+        syms = tuple(symbols)
+        plan = tuple((stream, syms) for stream in streams)
+    all_symbols = list(dict.fromkeys(sym for _, syms in plan for sym in syms))
+    return plan, all_symbols, [stream for stream, _ in plan]
+
+
+@lru_cache(maxsize=4096)
+def _clock(sec):
+    """Local HH:MM:SS for an epoch second, cached since ticks share seconds"""
+    t = time.localtime(sec)
+    return f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+
+def _noop(data):
+    """Ignore messages with an unknown or missing type"""
+
+
+def _drain(q):
+    """Discard everything currently waiting on a queue"""
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
+
+
+class TickBuffer:
+    """
+    Fixed-capacity ring buffer of ticks stored column-wise in compact arrays
+    Rows are only materialized as dicts when read, so recording a tick
+    allocates no per-tick Python objects
+    """
+    
+    KINDS = ('TRADE', 'QUOTE', 'BAR')
+    TRADE, QUOTE, BAR = range(3)
+    EXTRA_FIELDS = ('size', 'spread', None)  # row key for the extra column, per kind
+    
+    __slots__ = ('capacity', '_ts_ns', '_sym', '_kind', '_price', '_extra',
+                 '_symbols', '_sym_ids', '_sym_counts', '_kind_counts', '_head')
+    
+    def __init__(self, capacity=1 << 16):
+        """Preallocate one zero-filled column per tick field"""
+        self.capacity = capacity
+        self._ts_ns = array('q', bytes(8 * capacity))
+        self._sym = array('H', bytes(2 * capacity))
+        self._kind = array('B', bytes(capacity))
+        self._price = array('d', bytes(8 * capacity))
+        self._extra = array('d', bytes(8 * capacity))  # trade size or quote spread
+        self._symbols = []
+        self._sym_ids = {}
+        self._sym_counts = []  # ticks ever appended per symbol id, including overwritten ones
+        self._kind_counts = [0] * len(self.KINDS)
+        self._head = 0  # ticks appended so far
+    
+    def append(self, symbol, kind, price, extra=0.0, ts_ns=None):
+        """Record one tick, overwriting the oldest once full"""
+        sym_id = self._sym_ids.get(symbol)
+        if sym_id is None:
+            sym_id = self._sym_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+            self._sym_counts.append(0)
+        
+        i = self._head % self.capacity
+        self._sym_counts[sym_id] += 1
+        self._kind_counts[kind] += 1
+        self._ts_ns[i] = time.time_ns() if ts_ns is None else ts_ns
+        self._sym[i] = sym_id
+        self._kind[i] = kind
+        self._price[i] = price
+        self._extra[i] = extra
+        self._head += 1
+    
+    def _row(self, i):
+        """Materialize the tick at physical slot i as a dict"""
+        kind = self._kind[i]
+        row = {
+            'time': _clock(self._ts_ns[i] // 1_000_000_000),
+            'symbol': self._symbols[self._sym[i]],
+            'price': self._price[i],
+            'type': self.KINDS[kind]
+        }
+        extra = self.EXTRA_FIELDS[kind]
+        if extra is not None:
+            row[extra] = self._extra[i]
+        return row
+    
+    def __len__(self):
+        return min(self._head, self.capacity)
+    
+    def __getitem__(self, index):
+        n = len(self)
+        if isinstance(index, slice):
+            return [self[k] for k in range(*index.indices(n))]
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("tick index out of range")
+        return self._row((self._head - n + index) % self.capacity)
+    
+    def __iter__(self):
+        head, n = self._head, len(self)
+        for k in range(head - n, head):
+            yield self._row(k % self.capacity)
+    
+    def copy(self):
+        """Return the buffered ticks as a list of dicts, oldest first"""
+        return list(self)
+    
+    def symbol_counts(self):
+        """Count every tick appended per symbol, in first-seen order"""
+        return {sym: n for sym, n in zip(self._symbols, self._sym_counts) if n}
+    
+    def type_counts(self):
+        """Count every tick appended per type (TRADE/QUOTE/BAR)"""
+        return {kind: n for kind, n in zip(self.KINDS, self._kind_counts) if n}
+
 
 class CryptoAlpaca:
     """
@@ -19,8 +218,11 @@ class CryptoAlpaca:
     Provides real-time 24/7 crypto market data streaming via WebSocket
     """
     
-    def __init__(self, env_path=None):
-        """Initialize CryptoAlpaca with environment configuration"""
+    def __init__(self, env_path=None, pinned_core=None):
+        """
+        Initialize CryptoAlpaca with environment configuration
+        pinned_core optionally pins the frame consumer thread to one CPU (Linux only)
+        """
         # Load environment variables
         self._load_env(env_path)
         
@@ -29,6 +231,12 @@ class CryptoAlpaca:
         self.secret_key = os.getenv('SECRET_KEY')
         self.ws_url = os.getenv('CRYPTO_WS_URL', 'wss://stream.data.alpaca.markets/v1beta3/crypto/us')
         
+        # Authentication headers never change, so build them once for all (re)connects
+        self._ws_headers = [
+            f'APCA-API-KEY-ID: {self.api_key}',
+            f'APCA-API-SECRET-KEY: {self.secret_key}'
+        ]
+        
         # Popular crypto pairs
         cryptos_str = os.getenv('POPULAR_CRYPTOS', 'BTC/USD,ETH/USD,SOL/USD,AVAX/USD,ADA/USD,DOGE/USD')
         self.popular_cryptos = [c.strip() for c in cryptos_str.split(',')]
@@ -51,11 +259,59 @@ class CryptoAlpaca:
         self.is_connected = False
         self.is_ready = False
         self.subscribed_symbols = set()
+        self._ready_evt = threading.Event()  # set once the stream is authenticated
+        self._attempt_evt = threading.Event()  # set when a connect attempt authenticates or closes
+        self._auth_error = None  # set when the server rejects the credentials, so connect() stops retrying
+        self._stop_evt = threading.Event()  # set by disconnect() to wake waiting loops
+        self._data_evt = threading.Event()  # set after each batch of frames that recorded ticks
+        self._subscribed_evt = threading.Event()  # set when the server acknowledges a (un)subscribe
+        
+        # Message handlers keyed by Alpaca message type
+        self._handlers = {
+            't': self._handle_trade,
+            'q': self._handle_quote,
+            'b': self._handle_bar,
+            'success': self._handle_success,
+            'subscription': self._handle_subscription,
+            'error': self._handle_error
+        }
         
         # Data storage
         self.latest_prices = {}
-        self.price_data = []
+        self.price_data = TickBuffer()
         self.data_count = 0
+        self.dropped_quotes = 0  # quotes shed while the consumer was backlogged
+        
+        # Canonical (interned) symbol strings, so per-symbol dicts share one key object
+        self._symtab = {}
+        
+        # Per-symbol line formatters, chosen on the first tick for each symbol
+        self._quote_fmt = {}
+        self._bar_fmt = {}
+        
+        # Arrival time of the frame being processed, read once per frame
+        self._frame_ns = 0
+        
+        # Raw frames are handed off by the WebSocket thread and decoded by a
+        # consumer thread, so a burst never stalls the socket reads.
+        # Worker threads run from connect() until disconnect(); None on a queue stops its worker
+        self.pinned_core = pinned_core
+        self._inbox = queue.SimpleQueue()
+        self._consumer = None
+        
+        # Live ticker table: one line per symbol redrawn in place at <= 10 Hz
+        # instead of printing every tick
+        self.live_table = os.getenv('CRYPTO_LIVE_TABLE', '0') == '1'
+        self._ticker = {}
+        self._ticker_dirty = False
+        
+        # Tick lines are written to stdout in batches by a writer thread;
+        # quiet mode drops them entirely (e.g. for benchmarking)
+        self.quiet = os.getenv('CRYPTO_QUIET', '0') == '1'
+        self._out_q = queue.SimpleQueue()
+        self._writer = None
+        # Serialises worker start/stop between connect() and disconnect()
+        self._workers_lock = threading.Lock()
         
     def _load_env(self, env_path=None):
         """Load environment variables from .env file"""
@@ -72,201 +328,367 @@ class CryptoAlpaca:
                     break
         
         if env_path and Path(env_path).exists():
-            with open(env_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        os.environ[key.strip()] = value.strip()
-    
-    def connect(self):
-        """Connect to crypto WebSocket with authentication headers"""
+            for key, value in _ENV_RE.findall(Path(env_path).read_text()):
+                os.environ[key] = value
+    
+    def connect(self, retries=3):
+        """
+        Connect to crypto WebSocket with authentication headers
+        Failed attempts are retried up to `retries` times with jittered exponential backoff
+        """
         try:
             print("🔌 Connecting to crypto WebSocket...")
+            self._stop_evt.clear()
+            self._start_workers()
             
-            # Create WebSocket with authentication headers
-            headers = [
-                f'APCA-API-KEY-ID: {self.api_key}',
-                f'APCA-API-SECRET-KEY: {self.secret_key}'
-            ]
-            
-            self.ws = websocket.WebSocketApp(
-                self.ws_url,
-                header=headers,
-                on_open=self._on_open,
-                on_message=self._on_message,
-                on_error=self._on_error,
-                on_close=self._on_close
-            )
-            
-            # Run in separate thread
-            self.ws_thread = threading.Thread(target=self.ws.run_forever)
-            self.ws_thread.daemon = True
-            self.ws_thread.start()
-            
-            # Wait for connection
-            timeout = 5
-            start_time = time.time()
-            while not self.is_ready and time.time() - start_time < timeout:
-                time.sleep(0.1)
+            for attempt in range(retries + 1):
+                if self._open_socket():
+                    print("✅ Connected to crypto stream")
+                    print("✅ Crypto authenticated via headers")
+                    
+                    if self.live_table:
+                        ticker_thread = threading.Thread(target=self._run_ticker)
+                        ticker_thread.daemon = True
+                        ticker_thread.start()
+                    return True
+                
+                if self._auth_error is not None:
+                    print(f"❌ Authentication rejected ({self._auth_error}) - verify API credentials in .env")
+                    break
+                
+                if attempt == retries:
+                    print(f"❌ Connection failed after {retries + 1} attempts")
+                    break
+                
+                # 1.25s, 2.5s, 5s, ... capped at 35s, spread +/-20% so clients don't retry in lockstep
+                delay = min(_RETRY_CAP, _RETRY_BASE * 2 ** attempt) * random.uniform(0.8, 1.2)
+                print(f"⚠️ Connection attempt {attempt + 1} failed, retrying in {delay:.1f}s")
+                if self._stop_evt.wait(delay):
+                    break  # disconnect() called while backing off
             
-            if self.is_ready:
-                print("✅ Connected to crypto stream")
-                print("✅ Crypto authenticated via headers")
-                return True
-            else:
-                print("❌ Connection timeout")
-                return False
+            self._stop_workers()
+            return False
                 
         except Exception as e:
             print(f"❌ Connection error: {e}")
+            self._stop_workers()
             return False
     
+    def _start_workers(self):
+        """Start the frame consumer and, when tick lines are printed, the stdout writer"""
+        with self._workers_lock:
+            if self._consumer is None:
+                # Frames, close markers or sentinels left from an earlier session must not reach the new consumer
+                _drain(self._inbox)
+                self._consumer = threading.Thread(target=self._run_consumer)
+                self._consumer.daemon = True
+                self._consumer.start()
+            if self._writer is None and not self.quiet and not self.live_table:
+                _drain(self._out_q)
+                self._writer = threading.Thread(target=self._run_writer)
+                self._writer.daemon = True
+                self._writer.start()
+    
+    def _stop_workers(self):
+        """Let the consumer, then the writer, finish their queued work and exit; safe to call twice"""
+        with self._workers_lock:
+            consumer, self._consumer = self._consumer, None
+            writer, self._writer = self._writer, None
+            # Consumer first: the frames it still holds may queue more tick lines for the writer
+            for q, worker in ((self._inbox, consumer), (self._out_q, writer)):
+                if worker is not None:
+                    q.put(None)
+                    worker.join()
+    
+    def _open_socket(self):
+        """Start one WebSocket session; True once authenticated, False if it closes or times out"""
+        self._ready_evt.clear()
+        self._attempt_evt.clear()
+        self._auth_error = None
+        
+        # Create WebSocket with authentication headers
+        self.ws = websocket.WebSocketApp(
+            self.ws_url,
+            header=self._ws_headers,
+            on_open=self._on_open,
+            on_data=self._on_data,
+            on_error=self._on_error,
+            on_close=self._on_close
+        )
+        
+        # Run in separate thread; frames are handed over as raw bytes
+        self.ws_thread = threading.Thread(
+            target=self.ws.run_forever,
+            kwargs={'skip_utf8_validation': True}
+        )
+        self.ws_thread.daemon = True
+        self.ws_thread.start()
+        
+        # Wakes on authentication or on the socket closing, whichever comes first
+        self._attempt_evt.wait(timeout=5)
+        if self._ready_evt.is_set():
+            return True
+        
+        self.ws.close()
+        self.ws_thread.join(timeout=2)
+        # Detached, so callbacks from a socket still closing are ignored
+        self.ws = None
+        return False
+    
     def _on_open(self, ws):
         """Handle WebSocket connection open"""
+        if ws is not self.ws:
+            return  # an abandoned connect attempt
         print("🔗 Crypto WebSocket connected")
         self.is_connected = True
         # Don't set is_ready here - wait for actual authentication
     
-    def _on_message(self, ws, message):
-        """Handle incoming WebSocket messages"""
-        try:
-            data = json.loads(message)
-            
-            # Process different message types
-            if isinstance(data, list):
-                for item in data:
-                    self._process_crypto_data(item)
-            else:
-                self._process_crypto_data(data)
-                
-        except json.JSONDecodeError:
-            pass
-        except Exception as e:
-            print(f"❌ Message processing error: {e}")
+    def _on_data(self, ws, frame, opcode, fin):
+        """Queue incoming raw frames, stamped on arrival, for the consumer thread"""
+        if ws is not self.ws:
+            return  # late frame from an abandoned connect attempt
+        inbox = self._inbox
+        if inbox.qsize() > _INBOX_HIGH_WATER:
+            # Backlogged: quotes are superseded by the next one, so drop frames that
+            # carry nothing else and keep trades, bars and control messages
+            if _QUOTE_TAG in frame and _TRADE_TAG not in frame and _BAR_TAG not in frame:
+                self.dropped_quotes += frame.count(_QUOTE_TAG)
+                return
+        inbox.put((time.time_ns(), frame))
     
-    def _process_crypto_data(self, data):
-        """Process individual crypto data messages"""
-        if 'T' not in data:
-            return
-        
-        msg_type = data['T']
-        
-        # Handle authentication and connection messages
-        if msg_type == "success":
-            if data.get("msg") == "connected":
-                print("✅ Connected to crypto stream")
-            elif data.get("msg") == "authenticated":
-                print("✅ Crypto authenticated via headers")
-                self.is_ready = True  # Now ready to subscribe
-        
-        elif msg_type == "subscription":
-            if data.get("msg") == "subscribed":
-                print(f"✅ Subscription confirmed")
-        
-        elif msg_type == "error":
-            error_msg = str(data.get("msg", ""))
-            if "already authenticated" not in error_msg.lower():
-                print(f"❌ API Error: {error_msg}")
-        
-        # Process actual market data only after this point
-        
-        # Trade data
-        if msg_type == 't' and 'S' in data and 'p' in data:
-            symbol = data['S']
-            price = float(data['p'])
-            size = float(data.get('s', 0))
-            timestamp = data.get('t', '')
-            
-            self.latest_prices[symbol] = price
-            self.data_count += 1
+    def _run_consumer(self):
+        """Decode and dispatch queued frames in batches of up to 64"""
+        # Staying on one core keeps the handler state warm in that core's caches
+        if self.pinned_core is not None and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(threading.get_native_id(), {self.pinned_core})
+            except (OSError, ValueError, TypeError) as e:
+                # Unknown, negative or non-integer core: run unpinned rather than lose the consumer
+                print(f"⚠️ Could not pin consumer to CPU {self.pinned_core}: {e}")
+        
+        get = self._inbox.get
+        get_nowait = self._inbox.get_nowait
+        # Bound once so the per-frame and per-message work only touches locals
+        loads = _json_loads
+        dispatch = self._handlers.get
+        noop = _noop
+        data_ready = self._data_evt.set
+        attempt_done = self._attempt_evt.set
+        while True:
+            batch = [get()]
+            try:
+                while len(batch) < 64 and batch[-1] is not None:
+                    batch.append(get_nowait())
+            except queue.Empty:
+                pass
             
-            # Format time
-            time_str = datetime.now().strftime("%H:%M:%S")
+            # None is the stop sentinel from _stop_workers(); finish the frames before it
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
             
-            print(f"[{time_str}] 📈 {symbol} TRADE: ${price:,.2f} | Size: {size:.4f}")
-            
-            # Store for analysis
-            self.price_data.append({
-                'time': time_str,
-                'symbol': symbol,
-                'price': price,
-                'type': 'TRADE',
-                'size': size
-            })
-        
-        # Quote data
-        elif msg_type == 'q' and 'S' in data:
-            symbol = data['S']
-            bid = float(data.get('bp', 0))
-            ask = float(data.get('ap', 0))
+            count = self.data_count
+            for frame_ns, frame in batch:
+                if frame is None:
+                    # Socket closed; signalled here so the frames before it (e.g. an auth error) are handled first
+                    attempt_done()
+                    continue
+                self._frame_ns = frame_ns
+                try:
+                    data = loads(frame)
+                    
+                    # Alpaca always sends arrays; wrap a lone object just in case
+                    if type(data) is not list:
+                        data = (data,)
+                    
+                    # One table lookup and one call per message
+                    for item in data:
+                        dispatch(item.get('T'), noop)(item)
+                    
+                except json.JSONDecodeError:
+                    pass
+                except Exception as e:
+                    print(f"❌ Message processing error: {e}")
             
-            if bid > 0 and ask > 0:
-                mid_price = (bid + ask) / 2
-                spread = ask - bid
-                spread_pct = (spread / mid_price * 100) if mid_price > 0 else 0
-                
-                self.latest_prices[symbol] = mid_price
-                self.data_count += 1
-                
-                time_str = datetime.now().strftime("%H:%M:%S")
-                
-                # Format based on price magnitude
-                if symbol == "DOGE/USD":
-                    print(f"[{time_str}] 📊 {symbol} QUOTE: ${bid:.2f} / ${ask:.2f} | Spread: ${spread:.2f} ({spread_pct:.3f}%)")
-                elif mid_price > 1000:
-                    print(f"[{time_str}] 📊 {symbol} QUOTE: ${bid:,.2f} / ${ask:,.2f} | Spread: ${spread:.2f} ({spread_pct:.3f}%)")
-                else:
-                    print(f"[{time_str}] 📊 {symbol} QUOTE: ${bid:.2f} / ${ask:.2f} | Spread: ${spread:.2f} ({spread_pct:.3f}%)")
-                
-                self.price_data.append({
-                    'time': time_str,
-                    'symbol': symbol,
-                    'price': mid_price,
-                    'type': 'QUOTE',
-                    'spread': spread
-                })
-        
-        # Bar data
-        elif msg_type == 'b' and 'S' in data:
-            symbol = data['S']
-            open_price = float(data.get('o', 0))
-            high = float(data.get('h', 0))
-            low = float(data.get('l', 0))
-            close = float(data.get('c', 0))
-            volume = float(data.get('v', 0))
-            vwap = float(data.get('vw', 0))
+            if self.data_count != count:
+                data_ready()
+            if stop:
+                return
+    
+    def _handle_success(self, data):
+        """Handle connection and authentication messages"""
+        msg = data.get("msg")
+        if msg == "connected":
+            print("✅ Connected to crypto stream")
+        elif msg == "authenticated":
+            print("✅ Crypto authenticated via headers")
+            self.is_ready = True  # Now ready to subscribe
+            self._ready_evt.set()
+            self._attempt_evt.set()
+    
+    def _handle_subscription(self, data):
+        """Handle subscription acknowledgements"""
+        self._subscribed_evt.set()
+        if data.get("msg") == "subscribed":
+            print(f"✅ Subscription confirmed")
+    
+    def _handle_error(self, data):
+        """Handle API error messages"""
+        error_msg = str(data.get("msg", ""))
+        if "already authenticated" not in error_msg.lower():
+            print(f"❌ API Error: {error_msg}")
+        if data.get("code") in _FATAL_ERROR_CODES:
+            self._auth_error = error_msg
+            self._attempt_evt.set()
+    
+    def _handle_trade(self, data):
+        """Handle a trade message"""
+        try:
+            raw, price, size = _TRADE_FIELDS(data)
+        except KeyError:
+            return
+        
+        symbol = self._intern_symbol(raw)
+        
+        self._record(symbol, TickBuffer.TRADE, price, size)
+        if self.quiet:
+            return
+        
+        self._emit(symbol, _TRADE_LINE.format(t=self._time_str(), s=symbol, p=price, sz=size))
+    
+    def _handle_quote(self, data):
+        """Handle a quote message"""
+        try:
+            raw, bid, ask = _QUOTE_FIELDS(data)
+        except KeyError:
+            return
+        
+        symbol = self._intern_symbol(raw)
+        
+        if bid > 0 and ask > 0:
+            # Both sides are positive here, so the mid price can't be zero
+            mid_price = (bid + ask) * 0.5
+            spread = ask - bid
+            spread_pct = spread / mid_price * 100.0
             
-            self.latest_prices[symbol] = close
-            self.data_count += 1
+            self._record(symbol, TickBuffer.QUOTE, mid_price, spread)
+            if self.quiet:
+                return
             
-            time_str = datetime.now().strftime("%H:%M:%S")
+            # Format based on price magnitude, decided once per symbol
+            fmt = self._quote_fmt.get(symbol)
+            if fmt is None:
+                wide = mid_price > 1000 and symbol is not _DOGE
+                fmt = self._quote_fmt[symbol] = (_QUOTE_LINE_WIDE if wide else _QUOTE_LINE).format
             
-            if close > 1000:
-                print(f"[{time_str}] 📈 {symbol} BAR: O:${open_price:,.2f} H:${high:,.2f} L:${low:,.2f} C:${close:,.2f} | Vol: {volume:.2f} | VWAP: ${vwap:,.2f}")
-            else:
-                print(f"[{time_str}] 📈 {symbol} BAR: O:${open_price:.2f} H:${high:.2f} L:${low:.2f} C:${close:.2f} | Vol: {volume:.2f} | VWAP: ${vwap:.2f}")
+            self._emit(symbol, fmt(t=self._time_str(), s=symbol, b=bid, a=ask, sp=spread, pct=spread_pct))
+    
+    def _handle_bar(self, data):
+        """Handle a minute bar message"""
+        try:
+            raw, open_price, high, low, close, volume, vwap = _BAR_FIELDS(data)
+        except KeyError:
+            return
+        
+        symbol = self._intern_symbol(raw)
+        
+        self._record(symbol, TickBuffer.BAR, close)
+        if self.quiet:
+            return
+        
+        fmt = self._bar_fmt.get(symbol)
+        if fmt is None:
+            fmt = self._bar_fmt[symbol] = (_BAR_LINE_WIDE if close > 1000 else _BAR_LINE).format
+        
+        self._emit(symbol, fmt(t=self._time_str(), s=symbol, o=open_price, h=high, l=low, c=close, v=volume, vw=vwap))
+    
+    def _record(self, symbol, kind, price, extra=0.0):
+        """Update the latest price, tick count and price history for one tick"""
+        # JSON encoders may send whole prices as ints (150 for 150.0); keep the API all-float
+        price = float(price)
+        self.latest_prices[symbol] = price
+        self.data_count += 1
+        self.price_data.append(symbol, kind, price, extra, self._frame_ns)
+    
+    def _intern_symbol(self, raw):
+        """Canonical interned string for a symbol, registered the first time it is seen"""
+        try:
+            return self._symtab[raw]
+        except KeyError:
+            symbol = self._symtab[raw] = sys.intern(raw)
+            return symbol
+    
+    def _time_str(self):
+        """Return the current frame's HH:MM:SS"""
+        return _clock(self._frame_ns // 1_000_000_000)
+    
+    def _emit(self, symbol, line):
+        """Queue a tick line for output, or park it in the live ticker table"""
+        if self.live_table:
+            self._ticker[symbol] = line
+            self._ticker_dirty = True
+        else:
+            self._out_q.put(line)
+    
+    def _run_writer(self):
+        """Write queued tick lines to stdout, one write per batch every 50 ms"""
+        get = self._out_q.get
+        get_nowait = self._out_q.get_nowait
+        while True:
+            batch = [get()]
+            try:
+                while len(batch) < 256 and batch[-1] is not None:
+                    batch.append(get_nowait())
+            except queue.Empty:
+                pass
             
-            self.price_data.append({
-                'time': time_str,
-                'symbol': symbol,
-                'price': close,
-                'type': 'BAR'
-            })
+            # None is the stop sentinel: write what came before it and exit
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                sys.stdout.write("\n".join(batch) + "\n")
+                sys.stdout.flush()
+            if stop:
+                return
+            time.sleep(0.05)
+    
+    def _run_ticker(self):
+        """Redraw the live ticker table in place at up to 10 Hz"""
+        while not self._stop_evt.wait(0.1):
+            if not self._ticker_dirty:
+                continue
+            self._ticker_dirty = False
+            rows = sorted(self._ticker.items())
+            sys.stdout.write("\x1b[H\x1b[J" + "\n".join(line for _, line in rows) + "\n")
+            sys.stdout.flush()
     
     def _on_error(self, ws, error):
         """Handle WebSocket errors"""
+        if ws is not self.ws:
+            return
         if "Already authenticated" not in str(error):
             print(f"❌ WebSocket error: {error}")
+        # Credentials refused during the HTTP upgrade
+        if getattr(error, 'status_code', None) in (401, 403):
+            self._auth_error = str(error)
     
     def _on_close(self, ws, close_status_code, close_msg):
         """Handle WebSocket close"""
+        if ws is not self.ws:
+            return  # a late close from an abandoned attempt must not touch the current one
         print(f"🔌 Crypto WebSocket closed: {close_status_code} - {close_msg}")
         self.is_connected = False
         self.is_ready = False
+        self._ready_evt.clear()
+        # Queued behind any frames still waiting, so the consumer ends the attempt after handling them
+        self._inbox.put((time.time_ns(), None))
     
     def subscribe(self, symbols=None, streams=None):
-        """Subscribe to crypto symbols and data streams"""
+        """
+        Subscribe to crypto symbols and data streams
+        Pass a {stream: symbols} dict to subscribe different pairs per stream in one message
+        """
         if not self.is_ready:
             print("❌ Not connected to WebSocket")
             return False
@@ -277,27 +699,12 @@ class CryptoAlpaca:
         if streams is None:
             streams = self.default_streams
         
-        # Build subscription message using correct Alpaca crypto API format
-        subscribe_msg = {
-            "action": "subscribe"
-        }
-        
-        # Add stream subscriptions - Alpaca crypto uses full names, not single letters
-        for stream in streams:
-            if stream == "trades":
-                subscribe_msg["trades"] = symbols
-            elif stream == "quotes":
-                subscribe_msg["quotes"] = symbols
-            elif stream == "bars":
-                subscribe_msg["bars"] = symbols
-            elif stream == "daily_bars":
-                subscribe_msg["dailyBars"] = symbols
-            elif stream == "orderbook":
-                subscribe_msg["orderbooks"] = symbols
-        
-        # Send subscription
+        # Send subscription (payload is reused for repeat subscriptions)
         try:
-            self.ws.send(json.dumps(subscribe_msg))
+            plan, symbols, streams = _subscription_plan(symbols, streams)
+            payload = _control_payload("subscribe", plan)
+            self._subscribed_evt.clear()
+            self.ws.send(payload, opcode=websocket.ABNF.OPCODE_TEXT)
             self.subscribed_symbols.update(symbols)
             
             # Display subscription info
@@ -321,17 +728,11 @@ class CryptoAlpaca:
         if streams is None:
             streams = self.default_streams
         
-        unsubscribe_msg = {
-            "action": "unsubscribe"
-        }
-        
-        for stream in streams:
-            if stream in self.stream_types:
-                key = self.stream_types[stream]
-                unsubscribe_msg[key] = symbols
-        
         try:
-            self.ws.send(json.dumps(unsubscribe_msg))
+            plan, symbols, streams = _subscription_plan(symbols, streams)
+            payload = _control_payload("unsubscribe", plan)
+            self._subscribed_evt.clear()
+            self.ws.send(payload, opcode=websocket.ABNF.OPCODE_TEXT)
             for symbol in symbols:
                 self.subscribed_symbols.discard(symbol)
             return True
@@ -342,9 +743,31 @@ class CryptoAlpaca:
         """Disconnect from WebSocket"""
         if self.ws:
             print("🔌 Crypto streamer disconnected")
+            self._stop_evt.set()
             self.ws.close()
+            # Once the socket thread is gone no new frames arrive, so the workers can drain and exit
+            self.ws_thread.join(timeout=2)
+            # close() may outlast the join; detached, a late close no longer reaches the inbox
+            self.ws = None
+            self._stop_workers()
             self.is_connected = False
             self.is_ready = False
+            self._ready_evt.clear()
+    
+    def wait_until_ready(self, timeout=None):
+        """Block until the stream is authenticated; returns False on timeout"""
+        return self._ready_evt.wait(timeout)
+    
+    def wait_until_subscribed(self, timeout=None):
+        """Block until the server acknowledges the last (un)subscribe; returns False on timeout"""
+        return self._subscribed_evt.wait(timeout)
+    
+    def wait_for_data(self, timeout=None):
+        """Block until new ticks arrive after the previous call; returns False on timeout"""
+        if self._data_evt.wait(timeout):
+            self._data_evt.clear()
+            return True
+        return False
     
     def get_latest_price(self, symbol):
         """Get the latest price for a symbol"""
@@ -359,7 +782,11 @@ class CryptoAlpaca:
         if self.connect():
             if self.subscribe(symbols, streams):
                 print(f"⏰ Streaming for {duration} seconds...")
-                time.sleep(duration)
+                # Wait in 1 s slices so Ctrl+C still gets through on Windows
+                deadline = time.monotonic() + duration
+                while time.monotonic() < deadline:
+                    if self._stop_evt.wait(min(1, deadline - time.monotonic())):
+                        break
                 self.disconnect()
                 return True
         return False
@@ -391,8 +818,13 @@ class CryptoAlpaca:
                     idx = int(item) - 1
                     if 0 <= idx < len(self.popular_cryptos):
                         symbols.append(self.popular_cryptos[idx])
-                else:
+                elif valid_symbol(item.upper()):
                     symbols.append(item.upper())
+                elif item:
+                    print(f"⚠️ Skipping invalid symbol: {item}")
+            
+            if not symbols:
+                symbols = ["BTC/USD", "ETH/USD", "SOL/USD"]
         
         print(f"\n✅ Selected: {', '.join(symbols)}")
         print("\nConnecting...")
@@ -403,8 +835,9 @@ class CryptoAlpaca:
                 print("Press Ctrl+C to stop\n")
                 
                 try:
-                    while True:
-                        time.sleep(1)
+                    # Timed slices: an untimed wait can't be interrupted by Ctrl+C on Windows
+                    while not self._stop_evt.wait(1):
+                        pass
                 except KeyboardInterrupt:
                     print("\n\n⚠️ Stream interrupted by user")
                 
@@ -453,6 +886,11 @@ class CryptoAlpaca:
 
 
 # Convenience functions for quick usage
+def valid_symbol(symbol):
+    """Check that a symbol looks like a crypto pair, e.g. BTC/USD"""
+    return _SYMBOL_RE.fullmatch(symbol) is not None
+
+
 def quick_stream(symbols=["BTC/USD", "ETH/USD"], duration=30):
     """Quick streaming function"""
     crypto = CryptoAlpaca()
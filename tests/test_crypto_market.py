@@ -10,13 +10,25 @@ import time
 import threading
 from datetime import datetime, timedelta
 
-# Import the consolidated crypto class
-from crypto_alpaca import CryptoAlpaca
+# Progress line for the listen loop, bound once; ",.2f" groups thousands only from $1,000
+_PROGRESS_LINE = "Crypto data: {s} ${p:,.2f} ({t}) - Total: {n} updates".format
+
+# At most one progress line per this many seconds, however fast ticks arrive
+_REPORT_INTERVAL = 5.0
+
+
+def _trading_session(now):
+    """Return (is_weekend, is_after_hours) for one reading of the clock"""
+    hour = now.hour
+    return now.weekday() >= 5, hour < 9 or hour >= 16
 
 
 class CryptoMarketTester:
     """Interactive crypto market data tester with prompts and responses"""
     
+    __slots__ = ('test_results', 'price_data', 'symbol_counts', 'data_type_counts',
+                 'crypto', 'popular_cryptos', 'stream_types')
+    
     def __init__(self):
         self.test_results = {
             'connection': False,
@@ -24,11 +36,14 @@ class CryptoMarketTester:
             'subscription': False,
             'data_received': False,
             'price_count': 0,
+            'dropped_quotes': 0,
             'test_symbols': [],
             'market_status_24_7': False,
             'errors': []
         }
         self.price_data = []
+        self.symbol_counts = {}
+        self.data_type_counts = {}
         self.crypto = None
         
     def display_prompt(self, message):
@@ -55,6 +70,9 @@ class CryptoMarketTester:
         self.display_prompt("Testing crypto streaming module import and initialization")
         
         try:
+            # Imported here so a missing dependency is reported as a failed test, not a crash
+            from crypto_alpaca import CryptoAlpaca
+            
             self.crypto = CryptoAlpaca()
             self.popular_cryptos = self.crypto.popular_cryptos
             self.stream_types = self.crypto.stream_types
@@ -72,9 +90,9 @@ class CryptoMarketTester:
         self.test_results['market_status_24_7'] = True
         self.display_system_return("Crypto markets operate 24/7/365 - always available for trading")
         
-        current_time = datetime.now()
-        weekend_status = "Weekend" if current_time.weekday() >= 5 else "Weekday"
-        hour_status = "After-hours" if current_time.hour < 9 or current_time.hour >= 16 else "Market hours"
+        weekend, after_hours = _trading_session(datetime.now())
+        weekend_status = "Weekend" if weekend else "Weekday"
+        hour_status = "After-hours" if after_hours else "Market hours"
         
         self.display_system_return(f"Current: {weekend_status}, {hour_status} - Crypto still active")
         
@@ -98,10 +116,8 @@ class CryptoMarketTester:
         # Test 4: Authentication (Header-based)
         self.display_prompt("Waiting for crypto API authentication (header-based)")
         
-        # Wait for ready state
-        time.sleep(1)
-        
-        if self.crypto.is_ready:
+        # Wait for ready state (returns as soon as the stream is authenticated)
+        if self.crypto.wait_until_ready(timeout=1):
             self.display_system_return("Crypto authentication successful - JSON streaming ready")
             self.test_results['authentication'] = True
         else:
@@ -124,38 +140,43 @@ class CryptoMarketTester:
         # Test 6: Listen for Data
         self.display_prompt("Listening for real-time crypto market data (45 seconds - extended for crypto)")
         
-        # Capture initial state
-        start_time = time.time()
+        # Capture initial state; the deadline is monotonic so clock adjustments can't skew it
+        deadline = time.monotonic() + 45
         initial_count = self.crypto.data_count
         
-        # Wait for data
+        # Wait for data: wake as soon as the first tick lands, then once per report
         data_received = False
-        while time.time() - start_time < 45:
-            if self.crypto.data_count > initial_count:
+        last_reported = initial_count
+        while time.monotonic() < deadline:
+            count = self.crypto.data_count
+            if count > initial_count:
                 if not data_received:
                     data_received = True
+                    last_reported = count
                     latest_data = self.crypto.price_data[-1] if self.crypto.price_data else None
                     if latest_data:
                         self.display_system_return(f"First crypto data received! Type: {latest_data['type']}")
-                
-                # Check for updates periodically
-                if self.crypto.data_count > 0 and self.crypto.data_count % 5 == 0:
+                elif count > last_reported:
+                    # Report the latest tick once per interval, whenever anything new arrived
+                    last_reported = count
                     latest_data = self.crypto.price_data[-1] if self.crypto.price_data else None
                     if latest_data:
-                        symbol = latest_data['symbol']
-                        price = latest_data['price']
-                        data_type = latest_data['type']
-                        if price > 1000:
-                            self.display_system_return(f"Crypto data: {symbol} ${price:,.2f} ({data_type}) - Total: {self.crypto.data_count} updates")
-                        else:
-                            self.display_system_return(f"Crypto data: {symbol} ${price:.2f} ({data_type}) - Total: {self.crypto.data_count} updates")
+                        self.display_system_return(_PROGRESS_LINE(
+                            s=latest_data['symbol'], p=latest_data['price'], t=latest_data['type'], n=count))
             
-            time.sleep(1)
+            remaining = max(0, deadline - time.monotonic())
+            if data_received:
+                time.sleep(min(_REPORT_INTERVAL, remaining))
+            else:
+                self.crypto.wait_for_data(remaining)
         
         # Store results
         self.test_results['data_received'] = data_received
         self.test_results['price_count'] = self.crypto.data_count
-        self.price_data = self.crypto.price_data.copy()
+        self.test_results['dropped_quotes'] = self.crypto.dropped_quotes
+        self.price_data = self.crypto.price_data[-5:]  # only the report's sample rows are materialized
+        self.symbol_counts = self.crypto.price_data.symbol_counts()
+        self.data_type_counts = self.crypto.price_data.type_counts()
         
         # Test 7: Additional Top 10 Symbols
         self.display_prompt("Testing additional top 10 crypto symbols")
@@ -163,24 +184,25 @@ class CryptoMarketTester:
         additional_symbols = ["DOGE/USD", "ADA/USD", "TRX/USD", "AVAX/USD", "TON/USD"]
         if self.crypto.subscribe(additional_symbols, streams=["quotes"]):
             self.display_system_return(f"Successfully added {len(additional_symbols)} more crypto pairs")
-        
-        # Brief wait for additional data
-        time.sleep(5)
+            
+            # Move on as soon as the server acknowledges the new subscription
+            if self.crypto.wait_until_subscribed(timeout=5):
+                self.display_system_return("Additional subscription acknowledged by the server")
         
         # Test 8: 24/7 Operation Validation
         self.display_prompt("Validating 24/7 operation characteristics")
         
         # Check market availability
-        current_time = datetime.now()
+        weekend, after_hours = _trading_session(datetime.now())
         
         # Weekend check
-        if current_time.weekday() >= 5:
+        if weekend:
             self.display_system_return("Weekend Trading: ✅ Active")
         else:
             self.display_system_return("Weekend Trading: 🕐 Not applicable now")
         
         # After-hours check
-        if current_time.hour < 9 or current_time.hour >= 16:
+        if after_hours:
             self.display_system_return("After Hours Trading: ✅ Active")
         else:
             self.display_system_return("Market Hours Trading: ✅ Active")
@@ -217,167 +239,160 @@ class CryptoMarketTester:
         self.display_system_return(f"Current time: {time_str}")
         
         # Traditional market comparison
-        hour = current_time.hour
-        if hour < 9 or hour >= 16:
+        _, after_hours = _trading_session(current_time)
+        if after_hours:
             self.display_system_return("Traditional markets: 🔴 CLOSED - Crypto still active globally")
         else:
             self.display_system_return("Traditional markets: 🟢 OPEN - Both markets active")
     
     def display_test_results(self):
         """Display comprehensive test results"""
-        print()
-        print("=" * 80)
-        print("📊 CRYPTO MARKET TEST RESULTS")
-        print("=" * 80)
+        # Build the whole report and write it in one go rather than ~70 print calls
+        report = []
+        emit = report.append
+        
+        emit("")
+        emit("=" * 80)
+        emit("📊 CRYPTO MARKET TEST RESULTS")
+        emit("=" * 80)
         
         # Test Summary
-        print("🎯 TEST SUMMARY")
-        print("-" * 50)
-        print(f"Connection:        {'✅ SUCCESS' if self.test_results['connection'] else '❌ FAILED'}")
-        print(f"Authentication:    {'✅ SUCCESS' if self.test_results['authentication'] else '❌ FAILED'}")
-        print(f"Subscription:      {'✅ SUCCESS' if self.test_results['subscription'] else '❌ FAILED'}")
-        print(f"Data Reception:    {'✅ SUCCESS' if self.test_results['data_received'] else '❌ FAILED'}")
-        print(f"24/7 Operation:    {'✅ VERIFIED' if self.test_results['market_status_24_7'] else '❌ NOT VERIFIED'}")
-        print(f"Price Updates:     {self.test_results['price_count']}")
-        print()
+        emit("🎯 TEST SUMMARY")
+        emit("-" * 50)
+        emit(f"Connection:        {'✅ SUCCESS' if self.test_results['connection'] else '❌ FAILED'}")
+        emit(f"Authentication:    {'✅ SUCCESS' if self.test_results['authentication'] else '❌ FAILED'}")
+        emit(f"Subscription:      {'✅ SUCCESS' if self.test_results['subscription'] else '❌ FAILED'}")
+        emit(f"Data Reception:    {'✅ SUCCESS' if self.test_results['data_received'] else '❌ FAILED'}")
+        emit(f"24/7 Operation:    {'✅ VERIFIED' if self.test_results['market_status_24_7'] else '❌ NOT VERIFIED'}")
+        emit(f"Price Updates:     {self.test_results['price_count']}")
+        if self.test_results['dropped_quotes']:
+            emit(f"Dropped Quotes:    {self.test_results['dropped_quotes']} (shed under load)")
+        emit("")
         
         # Crypto Market Analysis
-        print("🪙 CRYPTO MARKET ANALYSIS")
-        print("-" * 50)
-        
-        # Count updates by symbol
-        symbol_counts = {}
-        data_type_counts = {}
+        emit("🪙 CRYPTO MARKET ANALYSIS")
+        emit("-" * 50)
         
-        for data in self.price_data:
-            symbol = data['symbol']
-            data_type = data['type']
-            
-            symbol_counts[symbol] = symbol_counts.get(symbol, 0) + 1
-            data_type_counts[data_type] = data_type_counts.get(data_type, 0) + 1
+        # Updates by symbol and type, kept up to date by the tick buffer as ticks arrive
+        symbol_counts = self.symbol_counts
+        data_type_counts = self.data_type_counts
         
-        print(f"Active crypto pairs: {len(symbol_counts)}")
+        emit(f"Active crypto pairs: {len(symbol_counts)}")
         
         if symbol_counts:
-            print("Crypto pairs with data:")
+            emit("Crypto pairs with data:")
             for symbol, count in symbol_counts.items():
-                print(f"  {symbol}: {count} updates")
+                emit(f"  {symbol}: {count} updates")
         
         if data_type_counts:
-            print("Data types received:")
+            emit("Data types received:")
             for data_type, count in data_type_counts.items():
-                print(f"  {data_type}: {count} messages")
+                emit(f"  {data_type}: {count} messages")
         
-        print()
+        emit("")
         
         # Sample Prices
         if self.price_data:
-            print("💎 SAMPLE CRYPTO PRICES")
-            print("-" * 50)
+            emit("💎 SAMPLE CRYPTO PRICES")
+            emit("-" * 50)
             
             # Show last 5 prices
-            for data in self.price_data[-5:]:
+            for data in self.price_data:
                 time_str = data['time']
                 symbol = data['symbol']
                 price = data['price']
                 data_type = data['type']
                 
-                # Format based on data type and price
+                # Comma grouping only kicks in from $1,000, so one format fits every price
                 if data_type == 'QUOTE' and 'spread' in data:
-                    spread = data['spread']
-                    if price > 1000:
-                        print(f"[{time_str}] {symbol} ${price:,.2f} ({data_type}) [Spread: ${spread:.2f}]")
-                    else:
-                        print(f"[{time_str}] {symbol} ${price:.2f} ({data_type}) [Spread: ${spread:.2f}]")
-                elif data_type == 'BAR':
-                    if price > 1000:
-                        print(f"[{time_str}] {symbol} ${price:,.2f} ({data_type})")
-                    else:
-                        print(f"[{time_str}] {symbol} ${price:.2f} ({data_type})")
+                    emit(f"[{time_str}] {symbol} ${price:,.2f} ({data_type}) [Spread: ${data['spread']:.2f}]")
                 else:
-                    if price > 1000:
-                        print(f"[{time_str}] {symbol} ${price:,.2f} ({data_type})")
-                    else:
-                        print(f"[{time_str}] {symbol} ${price:.2f} ({data_type})")
+                    emit(f"[{time_str}] {symbol} ${price:,.2f} ({data_type})")
             
-            print()
+            emit("")
         
         # 24/7 Operation Status
-        print("🌍 24/7 OPERATION STATUS")
-        print("-" * 50)
+        emit("🌍 24/7 OPERATION STATUS")
+        emit("-" * 50)
         
-        current_time = datetime.now()
+        weekend, after_hours = _trading_session(datetime.now())
         
         # Weekend status
-        if current_time.weekday() >= 5:
-            print("  Weekend Trading: 🟢 ACTIVE")
+        if weekend:
+            emit("  Weekend Trading: 🟢 ACTIVE")
         else:
-            print("  Weekend Trading: 🕐 N/A")
+            emit("  Weekend Trading: 🕐 N/A")
         
         # After-hours status
-        if current_time.hour < 9 or current_time.hour >= 16:
-            print("  After-Hours Activity: 🟢 ACTIVE")
+        if after_hours:
+            emit("  After-Hours Activity: 🟢 ACTIVE")
         else:
-            print("  Market Hours Activity: 🟢 ACTIVE")
+            emit("  Market Hours Activity: 🟢 ACTIVE")
         
-        print("  Global Market Access: 🟢 ACTIVE")
-        print("  Holiday Trading: 🟢 ACTIVE")
-        print()
+        emit("  Global Market Access: 🟢 ACTIVE")
+        emit("  Holiday Trading: 🟢 ACTIVE")
+        emit("")
         
         # Working Files
-        print("🚀 WORKING FILES")
-        print("-" * 50)
+        emit("🚀 WORKING FILES")
+        emit("-" * 50)
         
         if self.test_results['data_received'] and self.test_results['price_count'] > 0:
-            print("✅ CRYPTO STREAMING IS WORKING!")
-            print("📁 Working file: tests/crypto_alpaca.py")
-            print("💡 Usage: python crypto_alpaca.py")
-            print("🎯 Your API credentials provide access to real-time crypto data")
+            emit("✅ CRYPTO STREAMING IS WORKING!")
+            emit("📁 Working file: tests/crypto_alpaca.py")
+            emit("💡 Usage: python crypto_alpaca.py")
+            emit("🎯 Your API credentials provide access to real-time crypto data")
         elif self.test_results['connection'] and self.test_results['authentication']:
-            print("⚠️ CRYPTO CONNECTION WORKS - LIMITED DATA")
-            print("📁 System file: tests/crypto_alpaca.py")
-            print("💡 Connection successful, may be low activity period")
+            emit("⚠️ CRYPTO CONNECTION WORKS - LIMITED DATA")
+            emit("📁 System file: tests/crypto_alpaca.py")
+            emit("💡 Connection successful, may be low activity period")
         else:
-            print("❌ CRYPTO STREAMING FAILED")
-            print("📁 Check file: tests/crypto_alpaca.py")
-            print("💡 Verify API credentials in .env file")
+            emit("❌ CRYPTO STREAMING FAILED")
+            emit("📁 Check file: tests/crypto_alpaca.py")
+            emit("💡 Verify API credentials in .env file")
         
-        print()
-        print("📁 CONSOLIDATED CRYPTO SYSTEM:")
-        print("   • crypto_alpaca.py - Unified crypto trading class")
-        print("   • test_crypto_market.py - Comprehensive testing")
-        print("   • .env - Secure API credentials")
-        print()
+        emit("")
+        emit("📁 CONSOLIDATED CRYPTO SYSTEM:")
+        emit("   • crypto_alpaca.py - Unified crypto trading class")
+        emit("   • test_crypto_market.py - Comprehensive testing")
+        emit("   • .env - Secure API credentials")
+        emit("")
         
         # Recommendations
-        print("💡 RECOMMENDATIONS")
-        print("-" * 50)
+        emit("💡 RECOMMENDATIONS")
+        emit("-" * 50)
         
         if self.test_results['data_received']:
-            print("🚀 Crypto streaming is fully functional!")
-            print("🌍 Take advantage of 24/7 operation for global trading")
-            print("💰 Consider implementing automated crypto trading strategies")
-            print("📈 Crypto volatility provides more frequent price updates")
+            emit("🚀 Crypto streaming is fully functional!")
+            emit("🌍 Take advantage of 24/7 operation for global trading")
+            emit("💰 Consider implementing automated crypto trading strategies")
+            emit("📈 Crypto volatility provides more frequent price updates")
         else:
-            print("🔄 Crypto activity varies throughout the day")
-            print("📊 Peak activity: US market hours, major news events")
-            print("🌏 Different crypto pairs active at different global times")
-            print("⏰ Try again during high-volume periods")
+            emit("🔄 Crypto activity varies throughout the day")
+            emit("📊 Peak activity: US market hours, major news events")
+            emit("🌏 Different crypto pairs active at different global times")
+            emit("⏰ Try again during high-volume periods")
         
-        print("🌟 Unique advantage: Crypto markets never close")
-        print("🎯 Perfect for automated systems and global trading")
-        print("💡 Can trade when stock/options markets are closed")
+        emit("🌟 Unique advantage: Crypto markets never close")
+        emit("🎯 Perfect for automated systems and global trading")
+        emit("💡 Can trade when stock/options markets are closed")
         
-        print("=" * 80)
+        emit("=" * 80)
         
         # Show errors if any
         if self.test_results['errors']:
-            print("\n⚠️ ERRORS ENCOUNTERED:")
+            emit("\n⚠️ ERRORS ENCOUNTERED:")
             for error in self.test_results['errors']:
-                print(f"  - {error}")
+                emit(f"  - {error}")
+        
+        sys.stdout.write("\n".join(report) + "\n")
+        sys.stdout.flush()
     
     def interactive_ticker_check(self):
         """Interactive ticker check for user-specified cryptocurrency"""
+        # Already loaded by Test 1, so this is just a module-cache lookup
+        from crypto_alpaca import CryptoAlpaca, valid_symbol
+        
         print("\n" + "=" * 80)
         print("🔍 INTERACTIVE TICKER CHECK")
         print("=" * 80)
@@ -417,31 +432,33 @@ class CryptoMarketTester:
             if "/" not in user_input:
                 user_input = f"{user_input}/USD"
             
+            if not valid_symbol(user_input):
+                print(f"❌ {user_input} is not a valid crypto pair (expected e.g. BTC/USD)")
+                return
+            
             print(f"\n🔍 Testing real-time data for {user_input}...")
             print("=" * 50)
             
             # Create new crypto instance for dedicated test
-            from crypto_alpaca import CryptoAlpaca
             test_crypto = CryptoAlpaca()
             
+            # connect() only succeeds once the stream has authenticated
             if test_crypto.connect():
                 print(f"✅ Connected to crypto stream")
-                time.sleep(1)
                 
                 if test_crypto.subscribe([user_input], ["trades", "quotes"]):
                     print(f"✅ Subscribed to {user_input}")
                     print(f"🔍 Listening for live data for 15 seconds...")
                     print()
                     
-                    start_time = time.time()
-                    data_received = False
+                    # Announce the first tick the moment it lands, then listen out the window
+                    deadline = time.monotonic() + 15
+                    if test_crypto.wait_for_data(15):
+                        print(f"🎉 SUCCESS! Live {user_input} data received!")
                     
-                    while time.time() - start_time < 15:
-                        if test_crypto.data_count > 0 and not data_received:
-                            data_received = True
-                            print(f"🎉 SUCCESS! Live {user_input} data received!")
-                        
-                        time.sleep(1)
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        time.sleep(remaining)
                     
                     # Show results
                     if test_crypto.data_count > 0: